@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+File discovery and batching helpers shared by the scripts that process a
+source tree in parallel on the Ray cluster.
+"""
+
+import hashlib
+import heapq
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+def scan_tree(
+    directory: str,
+    match_file: Callable[[os.DirEntry], bool],
+    descend: Callable[[os.DirEntry], bool],
+) -> List[str]:
+    """
+    Walk a directory tree with os.scandir, collecting matching files.
+    
+    DirEntry caches the file type from the directory listing, so unlike
+    os.walk no extra stat() is needed per entry. Like os.walk, symlinked
+    directories are not descended into and directories that can't be
+    listed (or vanished) are skipped.
+    
+    Args:
+        directory: Root of the tree to walk
+        match_file: Whether a non-directory entry should be collected
+        descend: Whether a directory entry should be walked into
+    
+    Returns:
+        Paths of the matching files
+    """
+    matches = []
+    stack = [directory]
+    
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if not entry.is_symlink() and descend(entry):
+                            stack.append(entry.path)
+                    elif match_file(entry):
+                        matches.append(entry.path)
+        except OSError as e:
+            logger.debug(f"Skipping unreadable directory: {e}")
+    
+    return matches
+
+def find_files(
+    directory: str,
+    match_file: Callable[[os.DirEntry], bool],
+    descend: Callable[[os.DirEntry], bool],
+) -> List[str]:
+    """
+    Collect matching files under a directory, walking its top-level
+    subdirectories concurrently.
+    
+    scandir releases the GIL while waiting on the filesystem, so threads
+    overlap the directory reads. A thread pool isn't worth it for one or
+    two subdirectories.
+    
+    Args:
+        directory: Root of the tree to search
+        match_file: Whether a non-directory entry should be collected
+        descend: Whether a directory entry should be walked into
+    
+    Returns:
+        Paths of the matching files, in no particular order
+    """
+    matches = []
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink() and descend(entry):
+                    subdirectories.append(entry.path)
+            elif match_file(entry):
+                matches.append(entry.path)
+    
+    if len(subdirectories) <= 2:
+        for subdirectory in subdirectories:
+            matches.extend(scan_tree(subdirectory, match_file, descend))
+    else:
+        max_workers = min(32, (os.cpu_count() or 1) * 4, len(subdirectories))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for subdirectory_matches in executor.map(
+                lambda subdirectory: scan_tree(subdirectory, match_file, descend),
+                subdirectories
+            ):
+                matches.extend(subdirectory_matches)
+    
+    return matches
+
+def bucket_files_by_size(file_paths: List[str], num_buckets: int) -> List[List[str]]:
+    """
+    Split files into buckets with roughly equal total size in bytes, ordered
+    from the heaviest bucket to the lightest.
+    
+    Args:
+        file_paths: Paths of the files to split
+        num_buckets: Number of buckets to aim for; fewer are returned if
+            there are fewer files
+    
+    Returns:
+        Non-empty lists of file paths, heaviest first
+    """
+    sized_files = []
+    for file_path in file_paths:
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+        sized_files.append((size, file_path))
+    
+    # Greedily place the largest remaining file into the lightest bucket
+    num_buckets = max(1, min(num_buckets, len(sized_files)))
+    heap = [(0, i) for i in range(num_buckets)]
+    buckets = [[] for _ in range(num_buckets)]
+    for size, file_path in sorted(sized_files, reverse=True):
+        total, i = heapq.heappop(heap)
+        buckets[i].append(file_path)
+        heapq.heappush(heap, (total + size, i))
+    
+    # Hand out the heaviest buckets first so a large one isn't left running
+    # alone at the end while the other workers sit idle
+    totals = {i: total for total, i in heap}
+    order = sorted(range(num_buckets), key=lambda i: totals[i], reverse=True)
+    return [buckets[i] for i in order if buckets[i]]
+
+def user_cache_path(tool: str, directory: str) -> str:
+    """
+    Per-user cache location for a tool's state about a directory, so that
+    runs never write into the tree being processed.
+    
+    Args:
+        tool: Name of the tool, used as a subdirectory of the cache home
+        directory: Directory the cached state is about
+    
+    Returns:
+        $XDG_CACHE_HOME/<tool>/<hash of the absolute directory path>
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    name = hashlib.blake2b(os.path.abspath(directory).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_home, tool, name)
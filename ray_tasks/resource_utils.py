@@ -9,16 +9,18 @@ import psutil
 import os
 import socket
 import logging
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
-def get_node_resources() -> Dict[str, Any]:
+@lru_cache(maxsize=1)
+def _detect_node_resources() -> Dict[str, Any]:
     """
-    Get available resources on the current node
+    Detect the static resources of the current node once per process.
     
-    Returns:
-        Dictionary containing hostname, CPU count, memory, and GPU info
+    Hostname, DNS lookup and GPU probing (which may spawn nvidia-smi) do not
+    change over the lifetime of a process, so they are only queried once.
     """
     hostname = socket.gethostname()
     ip_address = socket.gethostbyname(hostname)
@@ -48,6 +50,16 @@ def get_node_resources() -> Dict[str, Any]:
         "gpu_count": gpu_count
     }
 
+def get_node_resources() -> Dict[str, Any]:
+    """
+    Get available resources on the current node
+    
+    Returns:
+        Dictionary containing hostname, CPU count, memory, and GPU info
+    """
+    # Return a copy so callers can't mutate the cached result
+    return dict(_detect_node_resources())
+
 def get_optimal_resource_allocation(
     task_type: str = "default", 
     file_size: Optional[int] = None,
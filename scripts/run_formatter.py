@@ -5,23 +5,39 @@ Supports running black, isort, and other formatters on Python code.
 """
 
 import argparse
+import hashlib
+import io
 import json
 import logging
+import mmap
 import os
+import re
+import shutil
 import subprocess
 import sys
 import time
-from glob import glob
+import tokenize
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import replace
+from fnmatch import translate
+from importlib import metadata
+from itertools import groupby
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple, Union
+from typing import Callable, Dict, Iterator, List, Optional, Any, Tuple, Union
 
-import ray
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Add the project root to the Python path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, project_root)
 
-from ray_tasks.resource_utils import get_cluster_resources
+from ray_tasks.file_utils import bucket_files_by_size, find_files, user_cache_path
+
+# Ray and the modules built on it are imported in main() once the arguments
+# have been validated, so --help and early exits don't pay for importing Ray
 
 # Configure logging
 logging.basicConfig(
@@ -39,6 +55,11 @@ def parse_args() -> argparse.Namespace:
         default="auto",
         help="Ray cluster address (default: auto)",
     )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Format in a local process pool instead of on a Ray cluster",
+    )
     parser.add_argument(
         "--directory",
         type=str,
@@ -90,6 +111,17 @@ def parse_args() -> argparse.Namespace:
         type=str,
         help="Output file for formatting results (default: stdout)",
     )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=None,
+        help="File recording already-formatted files (default: one per directory under ~/.cache/ray-formatter)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Format every file, ignoring the cache of already-formatted files",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -99,18 +131,27 @@ def parse_args() -> argparse.Namespace:
 
 def find_python_files(directory: str, include_pattern: str, exclude_patterns: List[str]) -> List[str]:
     """Find all Python files in a directory, excluding specified patterns."""
-    all_files = glob(os.path.join(directory, "**", include_pattern), recursive=True)
-    
-    # Filter out excluded files
+    # Compile the include glob and the exclude substrings once up front
+    include_re = re.compile(translate(include_pattern))
+    exclude_re = None
     if exclude_patterns:
-        filtered_files = []
-        for file_path in all_files:
-            if not any(
-                exclude_pattern in file_path
-                for exclude_pattern in exclude_patterns
-            ):
-                filtered_files.append(file_path)
-        files = filtered_files
+        exclude_re = re.compile("|".join(re.escape(pattern) for pattern in exclude_patterns))
+    
+    # Skip hidden entries, like glob does. Directories whose path matches
+    # exclude_re are pruned without being listed, since every path below
+    # them would match as well.
+    def match_file(entry: os.DirEntry) -> bool:
+        return not entry.name.startswith(".") and include_re.match(entry.name) is not None
+    
+    def descend(entry: os.DirEntry) -> bool:
+        return not entry.name.startswith(".") and (exclude_re is None or not exclude_re.search(entry.path))
+    
+    all_files = find_files(directory, match_file, descend)
+    
+    # Filter out excluded files; pruning only catches patterns that match a
+    # directory path, not ones that span into file names
+    if exclude_re is not None:
+        files = [file_path for file_path in all_files if not exclude_re.search(file_path)]
     else:
         files = all_files
     
@@ -120,214 +161,845 @@ def find_python_files(directory: str, include_pattern: str, exclude_patterns: Li
     logger.info(f"Found {len(files)} Python files to format")
     return files
 
-@ray.remote
-def format_file(
-    file_path: str,
-    formatters: List[str],
+def file_content_hash(file_path: str) -> str:
+    """Return a short hex digest of a file's contents."""
+    with open(file_path, "rb") as f:
+        # Hash through a read-only mapping rather than copying the file into
+        # a bytes object; empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.blake2b(b"", digest_size=16).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.blake2b(mapped, digest_size=16).hexdigest()
+
+def formatter_versions(formatters: List[str]) -> str:
+    """
+    Describe the installed version of each formatter, for cache keys.
+    
+    Formatters are listed in the order they run, since a different order
+    can produce different output.
+    """
+    versions = []
+    for formatter in formatters:
+        try:
+            versions.append(f"{formatter}={metadata.version(formatter)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{formatter}=unknown")
+    return ",".join(versions)
+
+# pyproject.toml path and [tool.black] settings for each directory, found
+# once per process
+_black_configs: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}
+
+def find_black_config(black: Any, file_path: str) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Find the pyproject.toml black's command line would use for a file, and
+    return its path (None if there is none) with its [tool.black] settings.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    found = _black_configs.get(directory)
+    if found is None:
+        config_path = black.find_pyproject_toml((directory,))
+        config = {}
+        if config_path is not None:
+            try:
+                config = black.parse_pyproject_toml(config_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable black config {config_path}: {e}")
+        found = _black_configs[directory] = (config_path, config)
+    return found
+
+def black_mode_from_config(black: Any, config: Dict[str, Any], line_length: int) -> Any:
+    """
+    Build a black.Mode from [tool.black] settings the way black's command line
+    does, with line_length (from --black-line-length) taking precedence.
+    """
+    return black.Mode(
+        target_versions={black.TargetVersion[v.upper()] for v in config.get("target_version", [])},
+        line_length=line_length,
+        is_pyi=bool(config.get("pyi", False)),
+        skip_source_first_line=bool(config.get("skip_source_first_line", False)),
+        string_normalization=not config.get("skip_string_normalization", False),
+        magic_trailing_comma=not config.get("skip_magic_trailing_comma", False),
+        preview=bool(config.get("preview", False)),
+        unstable=bool(config.get("unstable", False)),
+        enabled_features={black.Preview[f] for f in config.get("enable_unstable_feature", [])},
+    )
+
+# isort Config for each directory, profile and verbosity, built once per
+# process
+_isort_configs: Dict[Tuple[str, str, bool], Any] = {}
+
+def find_isort_config(isort: Any, file_path: str, profile: str, quiet: bool = True) -> Any:
+    """
+    Build the isort Config isort's command line would use for a file: the
+    settings of its project (pyproject.toml, .isort.cfg, setup.cfg, ...)
+    applied on top of profile.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    key = (directory, profile, quiet)
+    config = _isort_configs.get(key)
+    if config is None:
+        config = isort.Config(settings_path=directory, profile=profile, quiet=quiet)
+        _isort_configs[key] = config
+    return config
+
+def isort_settings_key(config: Any) -> str:
+    """Describe the settings an isort Config takes from config files, for cache keys."""
+    file_settings = [source for source in config.sources if source.get("source") not in ("defaults", "runtime")]
+    return json.dumps(
+        file_settings,
+        sort_keys=True,
+        default=lambda value: sorted(value) if isinstance(value, (set, frozenset)) else str(value),
+    )
+
+# autopep8 options for each directory and line length, built once per process
+_autopep8_options: Dict[Tuple[str, int], Any] = {}
+
+def find_autopep8_options(autopep8: Any, file_path: str, max_line_length: int) -> Any:
+    """
+    Build the options autopep8's command line would use for a file: the
+    [pycodestyle]/[flake8] settings of its project (setup.cfg, tox.ini, ...)
+    and [tool.autopep8] in pyproject.toml, with max_line_length taking
+    precedence as --max-line-length does.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    key = (directory, max_line_length)
+    options = _autopep8_options.get(key)
+    if options is None:
+        options = autopep8.parse_args(
+            ["--max-line-length", str(max_line_length), os.path.abspath(file_path)],
+            apply_config=True,
+        )
+        _autopep8_options[key] = options
+    return options
+
+def autopep8_settings_key(options: Any) -> str:
+    """Describe resolved autopep8 options, for cache keys."""
+    settings = {name: value for name, value in vars(options).items() if name != "files"}
+    return json.dumps(
+        settings,
+        sort_keys=True,
+        default=lambda value: sorted(value) if isinstance(value, (set, frozenset)) else str(value),
+    )
+
+# yapf style (a style file path or a predefined style name) for each
+# directory, found once per process
+_yapf_styles: Dict[str, str] = {}
+
+def find_yapf_style(file_resources: Any, file_path: str) -> str:
+    """Find the yapf style the command line would use for a file."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    style = _yapf_styles.get(directory)
+    if style is None:
+        style = _yapf_styles[directory] = file_resources.GetDefaultStyleForDir(directory)
+    return style
+
+def yapf_settings_key(style: str) -> str:
+    """Describe a yapf style, including the contents of a style file, for cache keys."""
+    if os.path.isfile(style):
+        return f"{style}={file_content_hash(style)}"
+    return style
+
+def load_format_cache(cache_file: str) -> Dict[str, Dict[str, Any]]:
+    """Load the cache of already-formatted files, or an empty cache."""
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable format cache {cache_file}: {e}")
+        return {}
+
+def save_format_cache(cache: Dict[str, Dict[str, Any]], cache_file: str) -> None:
+    """Write the cache of already-formatted files."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        with open(cache_file, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        logger.warning(f"Failed to write format cache {cache_file}: {e}")
+
+def filter_unchanged_files(
+    file_paths: List[str],
+    cache: Dict[str, Dict[str, Any]],
+    config_key: Callable[[str], str],
+) -> Tuple[List[str], List[str]]:
+    """
+    Split files into those that need formatting and those that are unchanged
+    since they were last found to be formatted with the same configuration.
+    
+    config_key maps a file to the key of the configuration it is formatted with.
+    """
+    to_format = []
+    unchanged = []
+    
+    for file_path in file_paths:
+        entry = cache.get(file_path)
+        if entry is None or entry.get("config") != config_key(file_path):
+            to_format.append(file_path)
+            continue
+        
+        try:
+            stat = os.stat(file_path)
+            if stat.st_size != entry["size"]:
+                to_format.append(file_path)
+            elif stat.st_mtime_ns == entry["mtime_ns"]:
+                unchanged.append(file_path)
+            elif file_content_hash(file_path) == entry["hash"]:
+                # Touched but not changed; remember the new mtime
+                entry["mtime_ns"] = stat.st_mtime_ns
+                unchanged.append(file_path)
+            else:
+                to_format.append(file_path)
+        except OSError:
+            to_format.append(file_path)
+    
+    return to_format, unchanged
+
+def update_format_cache(
+    cache: Dict[str, Dict[str, Any]],
+    results: List[Dict[str, Any]],
+    config_key: Callable[[str], str],
+    check_mode: bool,
+) -> None:
+    """Record files that are now known to be formatted in the cache."""
+    for result in results:
+        file_path = result["file"]
+        formatted = result["success"] and not (
+            check_mode and any(fr["modified"] for fr in result["formatters"].values())
+        )
+        if not formatted:
+            cache.pop(file_path, None)
+            continue
+        
+        try:
+            stat = os.stat(file_path)
+            cache[file_path] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "hash": file_content_hash(file_path),
+                "config": config_key(file_path),
+            }
+        except OSError:
+            cache.pop(file_path, None)
+
+# Formatters whose check mode reports on many files per invocation, and the
+# patterns used to attribute their per-file report lines back to individual
+# files. In write mode every formatter is given the whole batch.
+BATCH_FORMATTERS = {"black", "isort"}
+BATCH_OUTPUT_PATTERNS = {
+    "black": re.compile(
+        r"^(?P<kind>would reformat|reformatted|error: cannot (?:format|parse):?) "
+        r"(?P<path>.+?)(?::\d+:\d+|: .*)?$"
+    ),
+    "isort": re.compile(
+        r"^(?P<kind>ERROR): (?P<path>.+?) Imports are incorrectly sorted"
+    ),
+}
+
+# Absolute paths of formatter executables, resolved once per process
+_executable_paths: Dict[str, str] = {}
+
+def resolve_executable(name: str) -> str:
+    """
+    Resolve a formatter executable to an absolute path once per process.
+    
+    subprocess only takes its posix_spawn fast path for absolute executables;
+    unresolvable names are returned unchanged so the usual error surfaces.
+    """
+    path = _executable_paths.get(name)
+    if path is None:
+        path = _executable_paths[name] = shutil.which(name) or name
+    return path
+
+def build_formatter_command(
+    formatter: str,
+    file_paths: List[str],
     check_mode: bool = False,
     black_line_length: int = 88,
     isort_profile: str = "black",
     verbose: bool = False,
-) -> Dict[str, Any]:
-    """Format a single file using specified formatters."""
-    start_time = time.time()
-    result = {
-        "file": file_path,
-        "formatters": {},
-        "success": True,
-        "duration": 0,
-        "errors": [],
-    }
+) -> List[str]:
+    """Build the command line for running a formatter as a subprocess."""
+    if formatter == "black":
+        cmd = [resolve_executable("black")]
+        if check_mode:
+            cmd.append("--check")
+        cmd.extend(["--line-length", str(black_line_length)])
+        if verbose:
+            cmd.append("--verbose")
+        
+    elif formatter == "isort":
+        cmd = [resolve_executable("isort")]
+        if check_mode:
+            cmd.append("--check")
+        cmd.extend(["--profile", isort_profile])
+        if verbose:
+            cmd.append("--verbose")
+        
+    elif formatter == "autopep8":
+        cmd = [resolve_executable("autopep8")]
+        if not check_mode:
+            cmd.append("--in-place")
+        cmd.extend(["--max-line-length", str(black_line_length)])
+        if verbose:
+            cmd.append("--verbose")
+        
+    elif formatter == "yapf":
+        cmd = [resolve_executable("yapf")]
+        if not check_mode:
+            cmd.append("--in-place")
+        if verbose:
+            cmd.append("--verbose")
+        
+    else:
+        raise ValueError(f"Unsupported formatter: {formatter}")
     
-    for formatter in formatters:
-        formatter_result = {
-            "success": False,
-            "output": "",
-            "error": "",
-            "modified": False,
-        }
+    cmd.extend(file_paths)
+    return cmd
+
+def file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+    """Return (mtime_ns, size) for a file, or None if it can't be stat'ed."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def decode_source(data: bytes) -> Tuple[str, str, str]:
+    """
+    Decode Python source bytes using their declared encoding.
+    
+    Returns the source with newlines normalized to "\\n", the encoding, and
+    the file's original newline sequence so it can be written back unchanged.
+    """
+    encoding, lines = tokenize.detect_encoding(io.BytesIO(data).readline)
+    newline = "\r\n" if lines and lines[0].endswith(b"\r\n") else "\n"
+    with io.TextIOWrapper(io.BytesIO(data), encoding) as text:
+        return text.read(), encoding, newline
+
+def write_source(file_path: str, source: str, encoding: str, newline: str) -> None:
+    """
+    Write formatted source back in place, as black's command line does.
+    
+    Writing through the existing file, rather than replacing it, keeps
+    symlinks pointing at the formatted file and preserves hard links,
+    ownership and permissions.
+    """
+    with open(file_path, "w", encoding=encoding, newline=newline) as f:
+        f.write(source)
+
+def prefetch_files(file_paths: List[str]) -> None:
+    """Ask the kernel to start reading files into the page cache, in order."""
+    for file_path in file_paths:
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+class FormatterWorker:
+    """
+    Long-lived formatter worker that keeps black/isort imported between files.
+    
+    main() turns this into a Ray actor with ray.remote(); the plain class can
+    also be used directly to format files in the current process.
+    """
+    
+    def __init__(
+        self,
+        formatters: List[str],
+        check_mode: bool = False,
+        black_line_length: int = 88,
+        isort_profile: str = "black",
+        verbose: bool = False,
+    ):
+        self.formatters = formatters
+        self.check_mode = check_mode
+        self.black_line_length = black_line_length
+        self.isort_profile = isort_profile
+        self.verbose = verbose
+        
+        # Import the formatters once per worker and build their configs up
+        # front; fall back to the command-line tools if they aren't importable
+        self.black = None
+        self.black_modes = {}
+        if "black" in formatters:
+            try:
+                import black
+                self.black = black
+            except ImportError:
+                logger.warning("black is not importable, falling back to subprocess")
         
+        self.isort = None
+        if "isort" in formatters:
+            try:
+                import isort
+                self.isort = isort
+            except ImportError:
+                logger.warning("isort is not importable, falling back to subprocess")
+        
+        self.autopep8 = None
+        if "autopep8" in formatters:
+            try:
+                import autopep8
+                self.autopep8 = autopep8
+            except ImportError:
+                logger.warning("autopep8 is not importable, falling back to subprocess")
+        
+        self.yapf_api = None
+        self.yapf_file_resources = None
+        if "yapf" in formatters:
+            try:
+                from yapf.yapflib import file_resources, yapf_api
+                self.yapf_api = yapf_api
+                self.yapf_file_resources = file_resources
+            except ImportError:
+                logger.warning("yapf is not importable, falling back to subprocess")
+        
+        # Background thread that starts reading a batch's files from disk while
+        # earlier files in it are being formatted; needs posix_fadvise
+        self.prefetcher = None
+        if hasattr(os, "posix_fadvise"):
+            self.prefetcher = ThreadPoolExecutor(max_workers=1)
+        
+        # Formatters that can run in this process, by name, as functions from
+        # (source, file_path) to formatted source
+        self.in_process = {}
+        if self.black is not None:
+            self.in_process["black"] = self._format_black
+        if self.isort is not None:
+            self.in_process["isort"] = self._format_isort
+        if self.autopep8 is not None:
+            self.in_process["autopep8"] = self._format_autopep8
+        if self.yapf_api is not None:
+            self.in_process["yapf"] = self._format_yapf
+    
+    def _format_black(self, source: str, file_path: str) -> str:
+        """Format source with black in-process."""
+        black = self.black
+        
+        # Honour the project's [tool.black] settings, as the command line does;
+        # one mode is built per config file
+        config_path, config = find_black_config(black, file_path)
+        mode = self.black_modes.get(config_path)
+        if mode is None:
+            mode = black_mode_from_config(black, config, self.black_line_length)
+            self.black_modes[config_path] = mode
+        if file_path.endswith(".pyi"):
+            mode = replace(mode, is_pyi=True)
         try:
-            if formatter == "black":
-                cmd = ["black"]
-                if check_mode:
-                    cmd.append("--check")
-                cmd.extend(["--line-length", str(black_line_length)])
-                if verbose:
-                    cmd.append("--verbose")
-                cmd.append(file_path)
-                
-            elif formatter == "isort":
-                cmd = ["isort"]
-                if check_mode:
-                    cmd.append("--check")
-                cmd.extend(["--profile", isort_profile])
-                if verbose:
-                    cmd.append("--verbose")
-                cmd.append(file_path)
-                
-            elif formatter == "autopep8":
-                cmd = ["autopep8"]
-                if not check_mode:
-                    cmd.append("--in-place")
-                cmd.extend(["--max-line-length", str(black_line_length)])
-                if verbose:
-                    cmd.append("--verbose")
-                cmd.append(file_path)
-                
-            elif formatter == "yapf":
-                cmd = ["yapf"]
-                if not check_mode:
-                    cmd.append("--in-place")
-                if verbose:
-                    cmd.append("--verbose")
-                cmd.append(file_path)
-                
-            else:
-                raise ValueError(f"Unsupported formatter: {formatter}")
-            
-            # Run the formatter
-            process = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=False
-            )
-            
-            formatter_result["output"] = process.stdout
-            formatter_result["error"] = process.stderr
-            
-            # Check if the file was modified or would be modified
-            if process.returncode == 0:
+            return black.format_file_contents(source, fast=False, mode=mode)
+        except black.NothingChanged:
+            return source
+    
+    def _format_isort(self, source: str, file_path: str) -> str:
+        """Sort imports in source with isort in-process."""
+        # Honour the project's isort settings, as the command line does
+        config = find_isort_config(self.isort, file_path, self.isort_profile, quiet=not self.verbose)
+        try:
+            return self.isort.code(source, config=config, file_path=Path(file_path))
+        except self.isort.exceptions.FileSkipped:
+            return source
+    
+    def _format_autopep8(self, source: str, file_path: str) -> str:
+        """Format source with autopep8 in-process."""
+        # Honour the project's pycodestyle/flake8 settings, as the command line does
+        options = find_autopep8_options(self.autopep8, file_path, self.black_line_length)
+        return self.autopep8.fix_code(source, options=options)
+    
+    def _format_yapf(self, source: str, file_path: str) -> str:
+        """Format source with yapf in-process."""
+        # Pick up the project's yapf style the same way the command line does
+        style_config = find_yapf_style(self.yapf_file_resources, file_path)
+        formatted, _ = self.yapf_api.FormatCode(source, style_config=style_config, filename=file_path)
+        return formatted
+    
+    def _format_in_memory(self, file_path: str, formatters: List[str], result: Dict[str, Any]) -> None:
+        """
+        Run a chain of in-process formatters over one file and record their
+        outcomes in the file's result.
+        
+        The file is read once, each formatter is applied to the previous one's
+        output, and the final source is written back at most once.
+        """
+        start_time = time.time()
+        try:
+            with open(file_path, "rb") as f:
+                source, encoding, newline = decode_source(f.read())
+        except (OSError, SyntaxError, UnicodeDecodeError) as e:
+            for formatter in formatters:
+                result["formatters"][formatter] = {
+                    "success": False,
+                    "output": "",
+                    "error": str(e),
+                    "modified": False,
+                }
+                result["errors"].append(f"{formatter} exception: {str(e)}")
+            result["success"] = False
+            result["duration"] += time.time() - start_time
+            return
+        
+        current = source
+        for formatter in formatters:
+            formatter_result = {
+                "success": False,
+                "output": "",
+                "error": "",
+                "modified": False,
+            }
+            try:
+                formatted = self.in_process[formatter](current, file_path)
+                formatter_result["modified"] = formatted != current
                 formatter_result["success"] = True
-                # In check mode, no modifications means exit code 0
+                current = formatted
+            except Exception as e:
+                formatter_result["error"] = str(e)
+                result["success"] = False
+                result["errors"].append(f"{formatter} exception: {str(e)}")
+            result["formatters"][formatter] = formatter_result
+        
+        if current != source and not self.check_mode:
+            try:
+                write_source(file_path, current, encoding, newline)
+            except OSError as e:
+                result["success"] = False
+                result["errors"].append(f"write failed: {str(e)}")
+        
+        result["duration"] += time.time() - start_time
+    
+    def _run_subprocess(self, formatter: str, file_paths: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Run a formatter as a single subprocess over a batch of files.
+        
+        Returns a formatter result for each file, keyed by path. In write mode
+        modifications are detected from the files themselves, so every tool is
+        invoked once for the whole batch. In check mode only tools in
+        BATCH_FORMATTERS are, since their report lines can be mapped back to
+        individual files; other tools are given one file at a time.
+        """
+        batchable = formatter in BATCH_FORMATTERS or not self.check_mode
+        if not batchable and len(file_paths) > 1:
+            results = {}
+            for file_path in file_paths:
+                results.update(self._run_subprocess(formatter, [file_path]))
+            return results
+        
+        cmd = build_formatter_command(
+            formatter,
+            file_paths,
+            self.check_mode,
+            self.black_line_length,
+            self.isort_profile,
+            self.verbose,
+        )
+        
+        # In write mode, modifications are detected from the files themselves
+        # since the tools only report them on the (discarded) stdout
+        signatures = {}
+        if not self.check_mode:
+            signatures = {file_path: file_signature(file_path) for file_path in file_paths}
+        
+        # Run the formatter; stdout is only kept in verbose mode, otherwise it
+        # is discarded instead of being buffered and shipped back to the driver.
+        # close_fds=False (safe, as Python's own fds are non-inheritable) lets
+        # subprocess use posix_spawn rather than forking a large Ray worker.
+        process = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE if self.verbose else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            close_fds=False,
+            check=False
+        )
+        
+        results = {
+            file_path: {
+                "success": True,
+                "output": "",
+                "error": "",
+                "modified": False,
+            }
+            for file_path in file_paths
+        }
+        
+        if len(file_paths) == 1:
+            # Single file: the exit code alone describes the outcome
+            formatter_result = results[file_paths[0]]
+            formatter_result["output"] = process.stdout or ""
+            if process.returncode == 0:
                 formatter_result["modified"] = False
-            elif process.returncode == 1 and check_mode:
+            elif process.returncode == 1 and self.check_mode:
                 # In check mode, exit code 1 means the file would be modified
-                formatter_result["success"] = True
                 formatter_result["modified"] = True
             else:
                 # Any other exit code is an error
                 formatter_result["success"] = False
-                result["success"] = False
-                result["errors"].append(f"{formatter} failed: {process.stderr}")
+            
+            # Keep stderr only when it explains a failure or was asked for
+            if self.verbose or not formatter_result["success"]:
+                formatter_result["error"] = process.stderr
+        else:
+            # Multiple files: attribute each report line to the file it names
+            by_path = {os.path.abspath(file_path): file_path for file_path in file_paths}
+            pattern = BATCH_OUTPUT_PATTERNS.get(formatter)
+            attributed_failure = False
+            for line in process.stderr.splitlines() if pattern else ():
+                match = pattern.match(line.strip())
+                if not match:
+                    continue
+                file_path = by_path.get(os.path.abspath(match.group("path")))
+                if file_path is None:
+                    continue
+                formatter_result = results[file_path]
+                is_error = match.group("kind").startswith("error")
+                if is_error:
+                    formatter_result["success"] = False
+                    attributed_failure = True
+                elif self.check_mode:
+                    formatter_result["modified"] = True
                 
-        except Exception as e:
-            formatter_result["success"] = False
-            formatter_result["error"] = str(e)
-            result["success"] = False
-            result["errors"].append(f"{formatter} exception: {str(e)}")
+                # Routine report lines are only kept in verbose mode
+                if self.verbose or is_error:
+                    formatter_result["error"] += line + "\n"
+            
+            # A failing exit code that couldn't be pinned on a file fails the batch
+            failed = process.returncode not in (0, 1) or (process.returncode == 1 and not self.check_mode)
+            if failed and not attributed_failure:
+                for formatter_result in results.values():
+                    formatter_result["success"] = False
+                    formatter_result["error"] = process.stderr
+            
+            if self.verbose:
+                results[file_paths[0]]["output"] = process.stdout or ""
         
-        # Add results for this formatter
-        result["formatters"][formatter] = formatter_result
+        if not self.check_mode:
+            for file_path, formatter_result in results.items():
+                formatter_result["modified"] = file_signature(file_path) != signatures[file_path]
+        
+        return results
     
-    # Record duration
-    result["duration"] = time.time() - start_time
+    def format_file(self, file_path: str) -> Dict[str, Any]:
+        """Format a single file using the configured formatters."""
+        return self.format_files([file_path])[0]
     
-    return result
+    def format_files(self, file_paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Format a batch of files, returning one result per file.
+        
+        In-process formatters run file by file on the source in memory;
+        command-line formatters are invoked once for the whole batch and their
+        runtime is split evenly across the files.
+        """
+        results = {
+            file_path: {
+                "file": file_path,
+                "formatters": {},
+                "success": True,
+                "duration": 0,
+                "errors": [],
+            }
+            for file_path in file_paths
+        }
+        
+        # Overlap reading the files with formatting the ones already read
+        if self.prefetcher is not None:
+            self.prefetcher.submit(prefetch_files, file_paths)
+        
+        # Consecutive in-process formatters are chained in memory file by file;
+        # command-line formatters each run over the whole batch
+        for in_process, group in groupby(self.formatters, key=lambda f: f in self.in_process):
+            if in_process:
+                group = list(group)
+                for file_path in file_paths:
+                    self._format_in_memory(file_path, group, results[file_path])
+                continue
+            
+            for formatter in group:
+                start_time = time.time()
+                try:
+                    formatter_results = self._run_subprocess(formatter, file_paths)
+                except Exception as e:
+                    formatter_results = {
+                        file_path: {
+                            "success": False,
+                            "output": "",
+                            "error": str(e),
+                            "modified": False,
+                        }
+                        for file_path in file_paths
+                    }
+                share = (time.time() - start_time) / len(file_paths)
+                for file_path, formatter_result in formatter_results.items():
+                    result = results[file_path]
+                    result["duration"] += share
+                    result["formatters"][formatter] = formatter_result
+                    if not formatter_result["success"]:
+                        result["success"] = False
+                        result["errors"].append(f"{formatter} failed: {formatter_result['error']}")
+        
+        return list(results.values())
 
-def aggregate_format_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Aggregate formatting results from multiple files."""
-    aggregate = {
-        "total_files": len(results),
+# Formatter worker of a local pool process, created by _init_local_worker
+_local_worker: Optional[FormatterWorker] = None
+
+def _init_local_worker(*worker_args: Any) -> None:
+    """Create the formatter worker for a local pool process."""
+    global _local_worker
+    _local_worker = FormatterWorker(*worker_args)
+
+def _format_files_locally(file_paths: List[str]) -> List[Dict[str, Any]]:
+    """Format a batch of files with the current pool process's worker."""
+    return _local_worker.format_files(file_paths)
+
+def format_batches_locally(
+    batches: List[List[str]],
+    worker_args: Tuple[Any, ...],
+    num_workers: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Format batches of files in a local process pool, yielding each batch's
+    results as it completes.
+    
+    Each pool process keeps one FormatterWorker for its lifetime, like the
+    Ray actors do, without the cost of starting or connecting to Ray.
+    """
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_local_worker,
+        initargs=worker_args,
+    ) as executor:
+        futures = [executor.submit(_format_files_locally, batch) for batch in batches]
+        for future in as_completed(futures):
+            yield future.result()
+
+def init_aggregate(check_mode: bool = False) -> Dict[str, Any]:
+    """Create an empty aggregate to be filled in with update_aggregate."""
+    return {
+        "total_files": 0,
         "successful_files": 0,
         "failed_files": 0,
         "modified_files": 0,
         "would_modify_files": 0,
         "total_duration": 0,
         "formatter_stats": {},
-        "file_results": results,
+        "file_results": [],
+        "check": check_mode,
     }
+
+def update_aggregate(aggregate: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+    """Fold a batch of per-file formatting results into an aggregate in place."""
+    # Tally into locals and write the totals back once per batch
+    successful_files = 0
+    modified_files = 0
+    total_duration = 0.0
+    formatter_stats = aggregate["formatter_stats"]
     
-    # Initialize formatter stats
-    formatters_used = set()
-    for result in results:
-        formatters_used.update(result["formatters"].keys())
-    
-    for formatter in formatters_used:
-        aggregate["formatter_stats"][formatter] = {
-            "successful": 0,
-            "failed": 0,
-            "modified": 0,
-            "would_modify": 0,
-        }
+    # In check mode a "modified" result means the file would be modified
+    modified_key = "would_modify" if aggregate["check"] else "modified"
     
-    # Process results
     for result in results:
-        if result["success"]:
-            aggregate["successful_files"] += 1
-        else:
-            aggregate["failed_files"] += 1
-        
-        aggregate["total_duration"] += result["duration"]
+        successful_files += result["success"]
+        total_duration += result["duration"]
         
         file_modified = False
         for formatter, formatter_result in result["formatters"].items():
-            stats = aggregate["formatter_stats"][formatter]
-            
-            if formatter_result["success"]:
-                stats["successful"] += 1
-            else:
-                stats["failed"] += 1
+            stats = formatter_stats.get(formatter)
+            if stats is None:
+                stats = formatter_stats[formatter] = {
+                    "successful": 0,
+                    "failed": 0,
+                    "modified": 0,
+                    "would_modify": 0,
+                }
             
+            stats["successful" if formatter_result["success"] else "failed"] += 1
             if formatter_result["modified"]:
-                if "check" in result and result["check"]:
-                    stats["would_modify"] += 1
-                    file_modified = True
-                else:
-                    stats["modified"] += 1
-                    file_modified = True
-        
-        if file_modified:
-            if "check" in result and result["check"]:
-                aggregate["would_modify_files"] += 1
-            else:
-                aggregate["modified_files"] += 1
+                stats[modified_key] += 1
+                file_modified = True
+        
+        modified_files += file_modified
     
+    aggregate["file_results"].extend(results)
+    aggregate["total_files"] += len(results)
+    aggregate["successful_files"] += successful_files
+    aggregate["failed_files"] += len(results) - successful_files
+    aggregate[f"{modified_key}_files"] += modified_files
+    aggregate["total_duration"] += total_duration
+
+def aggregate_format_results(results: List[Dict[str, Any]], check_mode: bool = False) -> Dict[str, Any]:
+    """Aggregate formatting results from multiple files."""
+    aggregate = init_aggregate(check_mode)
+    update_aggregate(aggregate, results)
     return aggregate
 
-def write_results_to_file(results: Dict[str, Any], output_file: str) -> None:
+def write_results_to_file(results: Dict[str, Any], output_file: str, verbose: bool = False) -> None:
     """Write formatting results to a JSON file."""
+    # Formatter stdout is only captured in verbose mode; don't write out the
+    # empty placeholders for every file otherwise
+    if not verbose:
+        for file_result in results["file_results"]:
+            for formatter_result in file_result["formatters"].values():
+                formatter_result.pop("output", None)
+    
     try:
-        with open(output_file, "w") as f:
-            json.dump(results, f, indent=2)
+        if orjson is not None:
+            with open(output_file, "wb") as f:
+                f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, "w") as f:
+                json.dump(results, f, indent=2)
         logger.info(f"Formatting results written to {output_file}")
     except Exception as e:
         logger.error(f"Failed to write results to {output_file}: {e}")
 
 def print_summary(results: Dict[str, Any], check_mode: bool) -> None:
     """Print a summary of the formatting results."""
-    logger.info("\nFormatting Summary:")
-    logger.info("------------------")
-    logger.info(f"Total files processed: {results['total_files']}")
-    logger.info(f"Successfully processed files: {results['successful_files']}")
-    logger.info(f"Failed files: {results['failed_files']}")
+    # Assemble the whole summary and log it with a single call
+    lines = [
+        "",
+        "Formatting Summary:",
+        "------------------",
+        f"Total files processed: {results['total_files']}",
+        f"Successfully processed files: {results['successful_files']}",
+        f"Failed files: {results['failed_files']}",
+        f"Files skipped (unchanged since last run): {results.get('skipped_files', 0)}",
+    ]
     
     if check_mode:
-        logger.info(f"Files that would be modified: {results['would_modify_files']}")
+        lines.append(f"Files that would be modified: {results['would_modify_files']}")
     else:
-        logger.info(f"Files modified: {results['modified_files']}")
+        lines.append(f"Files modified: {results['modified_files']}")
     
-    logger.info(f"Total duration: {results['total_duration']:.2f} seconds")
+    lines.append(f"Total duration: {results['total_duration']:.2f} seconds")
     
-    logger.info("\nFormatter Stats:")
+    lines.append("")
+    lines.append("Formatter Stats:")
     for formatter, stats in results["formatter_stats"].items():
-        logger.info(f"  {formatter}:")
-        logger.info(f"    Successful: {stats['successful']}")
-        logger.info(f"    Failed: {stats['failed']}")
+        lines.append(f"  {formatter}:")
+        lines.append(f"    Successful: {stats['successful']}")
+        lines.append(f"    Failed: {stats['failed']}")
         if check_mode:
-            logger.info(f"    Would modify: {stats['would_modify']}")
+            lines.append(f"    Would modify: {stats['would_modify']}")
         else:
-            logger.info(f"    Modified: {stats['modified']}")
+            lines.append(f"    Modified: {stats['modified']}")
     
-    # Print files with errors if any
+    # List files with errors if any
     if results['failed_files'] > 0:
-        logger.info("\nFiles with errors:")
+        lines.append("")
+        lines.append("Files with errors:")
         for file_result in results['file_results']:
             if not file_result['success']:
-                logger.info(f"  {file_result['file']}:")
-                for error in file_result['errors']:
-                    logger.info(f"    {error}")
+                lines.append(f"  {file_result['file']}:")
+                lines.extend(f"    {error}" for error in file_result['errors'])
+    
+    logger.info("\n".join(lines))
 
 def main() -> int:
     """Main entry point for the formatting script."""
@@ -347,18 +1019,67 @@ def main() -> int:
     formatters = args.formatters.split(",") if args.formatters else ["black", "isort"]
     exclude_patterns = args.exclude.split(",") if args.exclude else []
     
-    # Initialize Ray
-    try:
-        ray.init(address=args.ray_address)
-        logger.info(f"Connected to Ray cluster at {args.ray_address}")
-        
-        # Get cluster resources for logging
-        resources = get_cluster_resources()
-        logger.info(f"Cluster resources: {resources}")
+    # Files are only skipped if they were formatted with the same settings
+    # The default cache lives outside the tree, so runs (including --check)
+    # never write into it
+    cache_file = args.cache_file or f"{user_cache_path('ray-formatter', directory)}.json"
+    base_config_key = f"{formatter_versions(formatters)}:{args.black_line_length}:{args.isort_profile}"
+    black = None
+    if "black" in formatters:
+        try:
+            import black
+        except ImportError:
+            pass
+    isort = None
+    if "isort" in formatters:
+        try:
+            import isort
+        except ImportError:
+            pass
+    autopep8 = None
+    if "autopep8" in formatters:
+        try:
+            import autopep8
+        except ImportError:
+            pass
+    yapf_file_resources = None
+    if "yapf" in formatters:
+        try:
+            from yapf.yapflib import file_resources as yapf_file_resources
+        except ImportError:
+            pass
+    
+    def config_key(file_path: str) -> str:
+        """Key of the settings a file is formatted with, including its project's formatter configs."""
+        parts = [base_config_key]
+        if black is not None:
+            _, black_config = find_black_config(black, file_path)
+            parts.append(json.dumps(black_config, sort_keys=True))
+        if isort is not None:
+            parts.append(isort_settings_key(find_isort_config(isort, file_path, args.isort_profile)))
+        if autopep8 is not None:
+            parts.append(autopep8_settings_key(find_autopep8_options(autopep8, file_path, args.black_line_length)))
+        if yapf_file_resources is not None:
+            parts.append(yapf_settings_key(find_yapf_style(yapf_file_resources, file_path)))
+        return ":".join(parts)
+    
+    # Initialize Ray, unless formatting in a local process pool
+    if not args.local:
+        import ray
+        from ray.util import ActorPool
+        from ray_tasks.resource_utils import get_cluster_resources
         
-    except Exception as e:
-        logger.error(f"Failed to connect to Ray cluster: {e}")
-        return 1
+        try:
+            ray.init(address=args.ray_address)
+            logger.info(f"Connected to Ray cluster at {args.ray_address}")
+            
+            # Get cluster resources for logging
+            resources = get_cluster_resources()
+            logger.info(f"Cluster resources: {resources}")
+            
+        except Exception as e:
+            logger.error(f"Failed to connect to Ray cluster: {e}")
+            return 1
     
     try:
         # Find Python files
@@ -368,32 +1089,71 @@ def main() -> int:
             logger.info("No Python files found. Exiting.")
             return 0
         
-        # Run formatters in parallel
-        format_tasks = [
-            format_file.remote(
-                file_path,
-                formatters,
-                args.check,
-                args.black_line_length,
-                args.isort_profile,
-                args.verbose
+        # Skip files that haven't changed since they were last formatted
+        cache = {} if args.no_cache else load_format_cache(cache_file)
+        python_files, unchanged_files = filter_unchanged_files(python_files, cache, config_key)
+        if unchanged_files:
+            logger.info(f"Skipping {len(unchanged_files)} files unchanged since last run")
+        
+        if not python_files:
+            logger.info("All files are unchanged since last run. Exiting.")
+            return 0
+        
+        # Start one long-lived formatter worker per CPU (but no more than there
+        # are files) so imports and formatter configs are reused across files
+        worker_args = (
+            formatters,
+            args.check,
+            args.black_line_length,
+            args.isort_profile,
+            args.verbose
+        )
+        if args.local:
+            num_workers = max(1, min(len(python_files), os.cpu_count() or 1))
+        else:
+            num_workers = max(1, min(len(python_files), int(resources.get("total_cpus", 1))))
+        
+        # Group files into size-balanced batches so each worker call carries
+        # enough work to amortize its scheduling overhead
+        batches = bucket_files_by_size(python_files, num_workers * 4)
+        
+        if args.local:
+            batch_results_iter = format_batches_locally(batches, worker_args, num_workers)
+            logger.info(f"Started {num_workers} local formatter processes")
+        else:
+            # Workers are spread evenly over the nodes rather than packed onto
+            # the first ones, so every node's CPUs share the work
+            remote_worker = ray.remote(scheduling_strategy="SPREAD")(FormatterWorker)
+            workers = [remote_worker.remote(*worker_args) for _ in range(num_workers)]
+            logger.info(f"Started {num_workers} formatter workers")
+            
+            pool = ActorPool(workers)
+            batch_results_iter = pool.map_unordered(
+                lambda worker, batch: worker.format_files.remote(batch),
+                batches
             )
-            for file_path in python_files
-        ]
+        logger.info(f"Split files into {len(batches)} batches")
         
-        # Get results
-        format_results = ray.get(format_tasks)
+        # Run formatters in parallel, folding each batch into the aggregate
+        # and the cache as soon as it completes rather than after all of them
+        aggregated_results = init_aggregate(args.check)
+        for batch_results in batch_results_iter:
+            update_aggregate(aggregated_results, batch_results)
+            if not args.no_cache:
+                update_format_cache(cache, batch_results, config_key, args.check)
+            logger.debug(f"Formatted {aggregated_results['total_files']}/{len(python_files)} files")
+        aggregated_results["skipped_files"] = len(unchanged_files)
         
-        # Aggregate results
-        aggregated_results = aggregate_format_results(format_results)
-        aggregated_results["check"] = args.check
+        # Remember which files are now formatted for the next run
+        if not args.no_cache:
+            save_format_cache(cache, cache_file)
         
         # Print summary
         print_summary(aggregated_results, args.check)
         
         # Write results to file if specified
         if args.output:
-            write_results_to_file(aggregated_results, args.output)
+            write_results_to_file(aggregated_results, args.output, args.verbose)
         
         # Return appropriate exit code
         if aggregated_results["failed_files"] > 0:
@@ -410,8 +1170,9 @@ def main() -> int:
         return 1
     finally:
         # Shutdown Ray
-        ray.shutdown()
-        logger.info("Ray shutdown complete")
+        if not args.local:
+            ray.shutdown()
+            logger.info("Ray shutdown complete")
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -11,16 +11,27 @@ import time
 import argparse
 import logging
 import json
-from typing import List, Dict, Any, Optional, Set, Tuple
+import heapq
+import hashlib
+import tempfile
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple, Union
 import ast
+import contextlib
+from collections import Counter
+import inspect
 import ray
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Add the project root to the Python path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, project_root)
 
-from ray_tasks.task_manager import distribute_tasks
 from ray_tasks.error_handling import retry
+from ray_tasks.file_utils import bucket_files_by_size, find_files, user_cache_path
 
 # Configure logging
 logging.basicConfig(
@@ -42,20 +53,138 @@ def find_python_files(directory: str, exclude_dirs: Optional[List[str]] = None)
     """
     if exclude_dirs is None:
         exclude_dirs = ["venv", "env", ".git", "__pycache__", "build", "dist"]
+    exclude_set = frozenset(exclude_dirs)
     
-    python_files = []
-    
-    for root, dirs, files in os.walk(directory):
-        # Skip excluded directories
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
+    return find_files(
+        directory,
+        lambda entry: entry.name.endswith(".py"),
+        lambda entry: entry.name not in exclude_set
+    )
+
+def _docstring(node: Union[ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef]) -> Optional[str]:
+    """Return a node's cleaned docstring, as ast.get_docstring does, from its first statement"""
+    body = node.body
+    if body and isinstance(body[0], ast.Expr):
+        value = body[0].value
+        if isinstance(value, ast.Constant) and isinstance(value.value, str):
+            return inspect.cleandoc(value.value)
+    return None
+
+# Each factory returns a handler specialised for one combination of index
+# flags, so the per-node code doesn't look the flags up again
+
+def _make_import_handler(include_line_numbers: bool) -> Callable[[ast.AST, Dict[str, Any]], None]:
+    """Build a handler that records the names bound by import statements"""
+    def index_import(node: Union[ast.Import, ast.ImportFrom], result: Dict[str, Any]) -> None:
+        line = node.lineno if include_line_numbers else None
+        module = node.module if isinstance(node, ast.ImportFrom) else None
+        for name in node.names:
+            result["imports"].append({
+                "name": f"{module}.{name.name}" if module else name.name,
+                "alias": name.asname,
+                "line": line
+            })
+    return index_import
+
+def _make_function_handler(
+    include_docstrings: bool,
+    include_line_numbers: bool
+) -> Callable[[ast.AST, Dict[str, Any]], None]:
+    """Build a handler that records function and method definitions (sync or async)"""
+    def index_function(node: Union[ast.FunctionDef, ast.AsyncFunctionDef], result: Dict[str, Any]) -> None:
+        result["functions"].append({
+            "name": node.name,
+            "params": [arg.arg for arg in node.args.args],
+            "docstring": _docstring(node) if include_docstrings else None,
+            "line": node.lineno if include_line_numbers else None,
+            "end_line": node.end_lineno if include_line_numbers else None,
+            "decorator_list": [d.id if isinstance(d, ast.Name) else None for d in node.decorator_list],
+            "is_async": isinstance(node, ast.AsyncFunctionDef)
+        })
+    return index_function
+
+def _make_class_handler(
+    include_docstrings: bool,
+    include_variables: bool,
+    include_line_numbers: bool
+) -> Callable[[ast.AST, Dict[str, Any]], None]:
+    """Build a handler that records class definitions with their methods and class variables"""
+    def index_class(node: ast.ClassDef, result: Dict[str, Any]) -> None:
+        bases = []
+        for base in node.bases:
+            if isinstance(base, ast.Name):
+                bases.append(base.id)
+            elif isinstance(base, ast.Attribute):
+                bases.append(f"{base.value.id}.{base.attr}" if isinstance(base.value, ast.Name) else "...")
+        
+        methods = []
+        class_vars = []
+        
+        # Find methods and class variables
+        for item in node.body:
+            if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                methods.append({
+                    "name": item.name,
+                    "params": [arg.arg for arg in item.args.args],
+                    "docstring": _docstring(item) if include_docstrings else None,
+                    "line": item.lineno if include_line_numbers else None,
+                    "is_async": isinstance(item, ast.AsyncFunctionDef)
+                })
+            elif include_variables and isinstance(item, ast.Assign):
+                for target in item.targets:
+                    if isinstance(target, ast.Name):
+                        class_vars.append({
+                            "name": target.id,
+                            "line": item.lineno if include_line_numbers else None
+                        })
         
-        for file in files:
-            if file.endswith(".py"):
-                python_files.append(os.path.join(root, file))
+        result["classes"].append({
+            "name": node.name,
+            "bases": bases,
+            "docstring": _docstring(node) if include_docstrings else None,
+            "methods": methods,
+            "class_vars": class_vars,
+            "line": node.lineno if include_line_numbers else None,
+            "end_line": node.end_lineno if include_line_numbers else None,
+            "decorator_list": [d.id if isinstance(d, ast.Name) else None for d in node.decorator_list]
+        })
+    return index_class
+
+# Specialised handler tables, by flags tuple, reused across the files of a
+# batch and across batches run by the same worker
+_index_handler_tables: Dict[Tuple[bool, ...], Dict[type, Callable[[ast.AST, Dict[str, Any]], None]]] = {}
+
+def _index_handlers(
+    include_docstrings: bool,
+    include_imports: bool,
+    include_functions: bool,
+    include_classes: bool,
+    include_variables: bool,
+    include_line_numbers: bool
+) -> Dict[type, Callable[[ast.AST, Dict[str, Any]], None]]:
+    """
+    Return the handlers for the indexed node types, by exact node type
     
-    return python_files
+    Node types whose kind is excluded from the index get no handler at all.
+    """
+    key = (include_docstrings, include_imports, include_functions,
+           include_classes, include_variables, include_line_numbers)
+    handlers = _index_handler_tables.get(key)
+    if handlers is None:
+        handlers = {}
+        if include_imports:
+            handlers[ast.Import] = handlers[ast.ImportFrom] = _make_import_handler(include_line_numbers)
+        if include_functions:
+            handlers[ast.FunctionDef] = handlers[ast.AsyncFunctionDef] = _make_function_handler(
+                include_docstrings, include_line_numbers
+            )
+        if include_classes:
+            handlers[ast.ClassDef] = _make_class_handler(
+                include_docstrings, include_variables, include_line_numbers
+            )
+        _index_handler_tables[key] = handlers
+    return handlers
 
-@ray.remote
 def index_file(
     file_path: str,
     include_docstrings: bool = True,
@@ -97,244 +226,281 @@ def index_file(
         return result
     
     try:
-        # Read the file
-        with open(file_path, 'r', encoding='utf-8') as f:
+        # Read the raw bytes and let the parser decode them, rather than
+        # decoding to str only for the parser to encode it again
+        with open(file_path, 'rb') as f:
             source_code = f.read()
         
         # Parse the AST
         tree = ast.parse(source_code, filename=file_path)
         
         # Extract module docstring if it exists
-        if include_docstrings and ast.get_docstring(tree):
-            result["docstring"] = ast.get_docstring(tree)
-        
-        # Create visitor to extract information
-        class CodeIndexVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.imports = []
-                self.functions = []
-                self.classes = []
-                self.variables = []
-            
-            def visit_Import(self, node):
-                if include_imports:
-                    for name in node.names:
-                        self.imports.append({
-                            "name": name.name,
-                            "alias": name.asname,
-                            "line": node.lineno if include_line_numbers else None
-                        })
-                self.generic_visit(node)
-            
-            def visit_ImportFrom(self, node):
-                if include_imports:
-                    module = node.module
-                    for name in node.names:
-                        self.imports.append({
-                            "name": f"{module}.{name.name}" if module else name.name,
-                            "alias": name.asname,
-                            "line": node.lineno if include_line_numbers else None
-                        })
-                self.generic_visit(node)
-            
-            def visit_FunctionDef(self, node):
-                if include_functions:
-                    params = []
-                    for arg in node.args.args:
-                        params.append(arg.arg)
-                    
-                    self.functions.append({
-                        "name": node.name,
-                        "params": params,
-                        "docstring": ast.get_docstring(node) if include_docstrings else None,
-                        "line": node.lineno if include_line_numbers else None,
-                        "end_line": node.end_lineno if include_line_numbers and hasattr(node, 'end_lineno') else None,
-                        "decorator_list": [d.id if isinstance(d, ast.Name) else None for d in node.decorator_list],
-                        "is_async": isinstance(node, ast.AsyncFunctionDef)
-                    })
-                self.generic_visit(node)
-            
-            def visit_AsyncFunctionDef(self, node):
-                self.visit_FunctionDef(node)  # Reuse the same logic
-            
-            def visit_ClassDef(self, node):
-                if include_classes:
-                    bases = []
-                    for base in node.bases:
-                        if isinstance(base, ast.Name):
-                            bases.append(base.id)
-                        elif isinstance(base, ast.Attribute):
-                            bases.append(f"{base.value.id}.{base.attr}" if isinstance(base.value, ast.Name) else "...")
-                    
-                    methods = []
-                    class_vars = []
-                    
-                    # Find methods and class variables
-                    for item in node.body:
-                        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                            params = []
-                            for arg in item.args.args:
-                                params.append(arg.arg)
-                            
-                            methods.append({
-                                "name": item.name,
-                                "params": params,
-                                "docstring": ast.get_docstring(item) if include_docstrings else None,
-                                "line": item.lineno if include_line_numbers else None,
-                                "is_async": isinstance(item, ast.AsyncFunctionDef)
-                            })
-                        elif isinstance(item, ast.Assign) and include_variables:
-                            for target in item.targets:
-                                if isinstance(target, ast.Name):
-                                    class_vars.append({
-                                        "name": target.id,
-                                        "line": item.lineno if include_line_numbers else None
-                                    })
-                    
-                    self.classes.append({
-                        "name": node.name,
-                        "bases": bases,
-                        "docstring": ast.get_docstring(node) if include_docstrings else None,
-                        "methods": methods,
-                        "class_vars": class_vars,
-                        "line": node.lineno if include_line_numbers else None,
-                        "end_line": node.end_lineno if include_line_numbers and hasattr(node, 'end_lineno') else None,
-                        "decorator_list": [d.id if isinstance(d, ast.Name) else None for d in node.decorator_list]
-                    })
-                self.generic_visit(node)
-            
-            def visit_Assign(self, node):
-                if include_variables:
-                    # Only include module-level variables
-                    if isinstance(node.parent, ast.Module):
-                        for target in node.targets:
-                            if isinstance(target, ast.Name):
-                                self.variables.append({
-                                    "name": target.id,
-                                    "line": node.lineno if include_line_numbers else None,
-                                    "value_type": type(node.value).__name__
-                                })
-                self.generic_visit(node)
+        if include_docstrings:
+            result["docstring"] = _docstring(tree) or None
         
-        # Add parent references to AST for better context
-        for node in ast.walk(tree):
-            for child in ast.iter_child_nodes(node):
-                child.parent = node
-        
-        # Visit the AST
-        visitor = CodeIndexVisitor()
-        visitor.visit(tree)
+        # Walk the AST in source order, dispatching on node type; with
+        # nothing to record there is no need to walk at all
+        handlers = _index_handlers(
+            include_docstrings, include_imports, include_functions,
+            include_classes, include_variables, include_line_numbers
+        )
+        if handlers:
+            stack = [tree]
+            while stack:
+                node = stack.pop()
+                handler = handlers.get(type(node))
+                if handler is not None:
+                    handler(node, result)
+                stack.extend(reversed(list(ast.iter_child_nodes(node))))
         
-        # Add the extracted information to the result
-        result["imports"] = visitor.imports
-        result["functions"] = visitor.functions
-        result["classes"] = visitor.classes
-        result["variables"] = visitor.variables
+        # Module-level variables are exactly the assignments in the module body
+        if include_variables:
+            for stmt in tree.body:
+                if isinstance(stmt, ast.Assign):
+                    for target in stmt.targets:
+                        if isinstance(target, ast.Name):
+                            result["variables"].append({
+                                "name": target.id,
+                                "line": stmt.lineno if include_line_numbers else None,
+                                "value_type": type(stmt.value).__name__
+                            })
         
     except Exception as e:
         result["error"] = f"Error parsing {file_path}: {str(e)}"
     
     return result
 
-@ray.remote
-def aggregate_index_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+def dumps_json(obj: Any, indent: bool = False) -> bytes:
+    """
+    Encode obj as JSON, with orjson when it is available
+    
+    orjson rejects some strings json accepts, such as lone surrogates from
+    escapes in a docstring, so those fall back to the json module, laid out
+    like orjson's output so the lines of one JSON Lines file match.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+        except orjson.JSONEncodeError:
+            pass
+    if indent:
+        text = json.dumps(obj, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    # A lone surrogate can't be encoded as UTF-8; backslashreplace writes it
+    # as the same \udXXX escape JSON uses inside a string
+    return text.encode("utf-8", "backslashreplace")
+
+def loads_json(data: bytes) -> Any:
+    """Decode JSON written by dumps_json"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # May be a json fallback holding an escaped lone surrogate
+            pass
+    return json.loads(data)
+
+def index_cache_key(file_path: str, flags: Dict[str, bool]) -> str:
+    """Key a file's cached index on its mtime, size and the index flags."""
+    stat = os.stat(file_path)
+    flags_tuple = tuple(sorted(flags.items()))
+    key = f"{stat.st_mtime_ns}:{stat.st_size}:{flags_tuple}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+def index_cache_path(cache_dir: str, file_path: str) -> str:
+    """Path of the cache entry for a file; one entry per file, overwritten on change."""
+    name = hashlib.blake2b(file_path.encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"{name}.json")
+
+def load_cached_index(entry_path: str, key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached index result if its key matches, else None."""
+    try:
+        with open(entry_path, 'rb') as f:
+            data = f.read()
+        entry = loads_json(data)
+    except (OSError, ValueError):
+        return None
+    if entry.get("key") != key:
+        return None
+    return entry.get("result")
+
+def store_cached_index(entry_path: str, key: str, result: Dict[str, Any]) -> None:
+    """Write a cache entry atomically, so concurrent tasks never see a partial file."""
+    cache_dir = os.path.dirname(entry_path)
+    try:
+        data = dumps_json({"key": key, "result": result})
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+    except OSError as e:
+        logger.warning(f"Failed to write index cache entry {entry_path}: {e}")
+
+def prune_index_cache(cache_dir: str, file_paths: List[str]) -> int:
     """
-    Aggregate indexing results from multiple files
+    Remove cache entries for files that are no longer indexed, such as
+    deleted or renamed files, so the cache doesn't grow without bound.
     
     Args:
-        results: List of indexing results
-        
+        cache_dir: Directory of per-file cached results, holding only
+            entries for the tree being indexed
+        file_paths: Paths of the files indexed in this run
+    
     Returns:
-        Dictionary with aggregated indexing results
+        Number of entries removed
     """
-    # Total counts
-    total_files = len(results)
-    successful_files = sum(1 for r in results if r.get("error") is None)
-    failed_files = total_files - successful_files
-    
-    # Error files (files that couldn't be indexed)
-    error_files = [
-        {"file_path": r["file_path"], "error": r["error"]}
-        for r in results
-        if r.get("error") is not None
-    ]
-    
-    # Collect all unique imports across all files
-    all_imports = {}
+    keep = {os.path.basename(index_cache_path(cache_dir, file_path)) for file_path in file_paths}
+    removed = 0
+    try:
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                if entry.name in keep or not entry.is_file():
+                    continue
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError as e:
+                    logger.debug(f"Failed to remove stale index cache entry {entry.path}: {e}")
+    except OSError as e:
+        logger.warning(f"Failed to prune index cache {cache_dir}: {e}")
+    return removed
+
+def encode_index_records(results: List[Dict[str, Any]]) -> bytes:
+    """
+    Encode a batch of results as JSON Lines, one record per file.
     
-    # Collect class and function definitions for cross-referencing
-    all_definitions = {
-        "classes": {},
-        "functions": {}
+    Ray stores bytes as a single buffer instead of pickling every nested
+    dict, and the driver can write the buffer out without decoding it.
+    """
+    return b"".join(dumps_json(r) + b"\n" for r in results)
+
+def init_index_aggregate() -> Dict[str, Any]:
+    """Create an empty aggregate for update_index_aggregate"""
+    return {
+        "total_files": 0,
+        "successful_files": 0,
+        "failed_files": 0,
+        "error_files": [],
+        # Number of files each import is used in
+        "import_counts": Counter(),
+        # Unique fully qualified names of the defined classes and functions
+        "classes": set(),
+        "functions": set()
     }
+
+def update_index_aggregate(aggregate: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+    """
+    Fold a batch of indexing results into an aggregate
     
-    # Import dependencies between files
-    import_graph = {}
+    Args:
+        aggregate: Aggregate from init_index_aggregate
+        results: Indexing results for one batch of files
+    """
+    import_counts = aggregate["import_counts"]
     
-    # Process each file's results
     for r in results:
+        aggregate["total_files"] += 1
         if r.get("error") is not None:
+            aggregate["failed_files"] += 1
+            aggregate["error_files"].append({"file_path": r["file_path"], "error": r["error"]})
             continue
+        aggregate["successful_files"] += 1
         
-        file_path = r["file_path"]
-        module_name = r["module_name"]
-        
-        # Track all imports and where they're used
-        for imp in r.get("imports", []):
-            import_name = imp["name"]
-            if import_name not in all_imports:
-                all_imports[import_name] = {"used_in": set()}
-            all_imports[import_name]["used_in"].add(file_path)
+        # Count each import once per file that uses it
+        import_counts.update({imp["name"] for imp in r.get("imports", [])})
         
-        # Track all class definitions
+        module_name = r["module_name"]
         for cls in r.get("classes", []):
-            class_name = cls["name"]
-            full_name = f"{module_name}.{class_name}"
-            all_definitions["classes"][full_name] = {
-                "defined_in": file_path,
-                "docstring": cls.get("docstring"),
-                "bases": cls.get("bases", []),
-                "method_count": len(cls.get("methods", [])),
-                "class_var_count": len(cls.get("class_vars", [])),
-                "line": cls.get("line")
-            }
-        
-        # Track all function definitions
+            aggregate["classes"].add(f"{module_name}.{cls['name']}")
         for func in r.get("functions", []):
-            func_name = func["name"]
-            full_name = f"{module_name}.{func_name}"
-            all_definitions["functions"][full_name] = {
-                "defined_in": file_path,
-                "docstring": func.get("docstring"),
-                "param_count": len(func.get("params", [])),
-                "is_async": func.get("is_async", False),
-                "line": func.get("line")
-            }
+            aggregate["functions"].add(f"{module_name}.{func['name']}")
+
+def merge_index_aggregate(aggregate: Dict[str, Any], partial: Dict[str, Any]) -> None:
+    """
+    Merge a batch's partial aggregate into the running aggregate
+    
+    Args:
+        aggregate: Running aggregate from init_index_aggregate
+        partial: Aggregate of one batch, as returned by index_file_batch
+    """
+    aggregate["total_files"] += partial["total_files"]
+    aggregate["successful_files"] += partial["successful_files"]
+    aggregate["failed_files"] += partial["failed_files"]
+    aggregate["error_files"].extend(partial["error_files"])
+    aggregate["import_counts"].update(partial["import_counts"])
+    aggregate["classes"] |= partial["classes"]
+    aggregate["functions"] |= partial["functions"]
+
+# Batches are spread evenly over the nodes rather than packed onto the
+# first ones, so parsing uses every node's CPUs
+@ray.remote(scheduling_strategy="SPREAD")
+def index_file_batch(
+    file_paths: List[str],
+    flags: Dict[str, bool],
+    cache_dir: Optional[str] = None,
+    include_records: bool = True
+) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """
+    Index a batch of Python files in a single task
+    
+    The batch is aggregated here, so the driver only merges one small
+    partial aggregate per batch rather than walking every file's results.
+    
+    Args:
+        file_paths: Paths of the files to index
+        flags: index_file keyword arguments (include_docstrings, ...)
+        cache_dir: Directory of per-file cached results, or None to disable caching
+        include_records: Whether to return the per-file records as well
         
-        # Create import dependency graph
-        import_graph[file_path] = {
-            "imports": [imp["name"] for imp in r.get("imports", [])]
-        }
-    
-    # Convert sets to lists for JSON serialization
-    for imp_name, imp_data in all_imports.items():
-        imp_data["used_in"] = list(imp_data["used_in"])
-    
-    # Create overall summary
-    summary = {
-        "total_files": total_files,
-        "successful_files": successful_files,
-        "failed_files": failed_files,
-        "error_files": error_files,
-        "total_imports": len(all_imports),
-        "total_classes": len(all_definitions["classes"]),
-        "total_functions": len(all_definitions["functions"]),
-        "imports": all_imports,
-        "definitions": all_definitions,
-        "import_graph": import_graph
-    }
+    Returns:
+        Tuple of the batch's aggregate and, if include_records, its per-file
+        records encoded with encode_index_records
+    """
+    if cache_dir is None:
+        results = [index_file(file_path, **flags) for file_path in file_paths]
+    else:
+        results = []
+        for file_path in file_paths:
+            # Stat before parsing, so a file edited mid-run is re-indexed next time
+            try:
+                key = index_cache_key(file_path, flags)
+            except OSError:
+                results.append(index_file(file_path, **flags))
+                continue
+            
+            entry_path = index_cache_path(cache_dir, file_path)
+            result = load_cached_index(entry_path, key)
+            if result is None:
+                result = index_file(file_path, **flags)
+                if result["error"] is None:
+                    store_cached_index(entry_path, key, result)
+            results.append(result)
+    
+    aggregate = init_index_aggregate()
+    update_index_aggregate(aggregate, results)
+    return aggregate, encode_index_records(results) if include_records else None
+
+def summarize_index_aggregate(aggregate: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the index summary from a running aggregate
     
-    return summary
+    Args:
+        aggregate: Running aggregate from init_index_aggregate
+        
+    Returns:
+        Dictionary with the summary of the indexing results
+    """
+    return {
+        "total_files": aggregate["total_files"],
+        "successful_files": aggregate["successful_files"],
+        "failed_files": aggregate["failed_files"],
+        "error_files": aggregate["error_files"],
+        "total_imports": len(aggregate["import_counts"]),
+        "total_classes": len(aggregate["classes"]),
+        "total_functions": len(aggregate["functions"]),
+        "import_counts": dict(aggregate["import_counts"])
+    }
 
 def create_index(
     directory: str,
@@ -346,7 +512,8 @@ def create_index(
     include_functions: bool = True,
     include_classes: bool = True,
     include_variables: bool = True,
-    include_line_numbers: bool = True
+    include_line_numbers: bool = True,
+    cache_dir: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Index all Python files in the specified directory using Ray
@@ -355,16 +522,18 @@ def create_index(
         directory: Directory containing Python files to index
         batch_size: Number of files to process in each batch
         exclude_dirs: Directories to exclude
-        output_file: File to write results to
+        output_file: JSON Lines file to write per-file results to; the summary goes to <output_file>.summary.json
         include_docstrings: Whether to include docstrings in the index
         include_imports: Whether to include imports in the index
         include_functions: Whether to include functions in the index
         include_classes: Whether to include classes in the index
         include_variables: Whether to include variables in the index
         include_line_numbers: Whether to include line numbers in the index
+        cache_dir: Directory of per-file cached results for this tree, or None to
+            disable caching; entries for files not indexed this run are removed
         
     Returns:
-        Dictionary with indexing results
+        Dictionary with the summary of the indexing results
     """
     start_time = time.time()
     
@@ -391,40 +560,68 @@ def create_index(
     def show_progress(current, total):
         logger.info(f"Progress: {current}/{total} files ({current/total*100:.1f}%)")
     
-    # Use task manager to distribute indexing tasks
-    results = distribute_tasks(
-        task_func=index_file,
-        items=python_files,
-        task_type="indexing",
-        batch_size=batch_size,
-        progress_callback=show_progress,
-        retry_attempts=2,
-        # Pass indexing parameters
-        remote_args={
-            "include_docstrings": include_docstrings,
-            "include_imports": include_imports,
-            "include_functions": include_functions,
-            "include_classes": include_classes,
-            "include_variables": include_variables,
-            "include_line_numbers": include_line_numbers
-        }
-    )
+    # Index files in batches, one task per batch, so scheduling overhead is
+    # paid per batch rather than per file; aim for about four batches per CPU.
+    # Batches are balanced by bytes rather than file count so one large file
+    # doesn't make its batch the straggler.
+    num_cpus = int(ray.cluster_resources().get("CPU", 1))
+    chunk_size = max(batch_size, len(python_files) // (num_cpus * 4))
+    num_batches = -(-len(python_files) // chunk_size)
+    batches = bucket_files_by_size(python_files, num_batches)
+    logger.info(f"Indexing in {len(batches)} size-balanced batches")
+    
+    flags = {
+        "include_docstrings": include_docstrings,
+        "include_imports": include_imports,
+        "include_functions": include_functions,
+        "include_classes": include_classes,
+        "include_variables": include_variables,
+        "include_line_numbers": include_line_numbers
+    }
+    
+    # Unchanged files are served from the cache by the batch tasks, so the
+    # directory must be an absolute path that every worker can reach
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+    # Per-file records are only shipped back when there is a file to write them to
+    include_records = bool(output_file)
+    pending = [
+        index_file_batch.remote(batch, flags, cache_dir, include_records)
+        for batch in batches
+    ]
     
-    # Aggregate results
-    logger.info("Aggregating indexing results...")
-    aggregated = ray.get(aggregate_index_results.remote(results))
+    # Merge each batch's partial aggregate as it completes, streaming its
+    # per-file records to the output file rather than holding them all
+    aggregate = init_index_aggregate()
+    with open(output_file, 'wb') if output_file else contextlib.nullcontext() as output:
+        while pending:
+            done, pending = ray.wait(pending, num_returns=1)
+            for partial, records in ray.get(done):
+                merge_index_aggregate(aggregate, partial)
+                if output is not None:
+                    output.write(records)
+            show_progress(aggregate["total_files"], len(python_files))
+    
+    if cache_dir is not None:
+        removed = prune_index_cache(cache_dir, python_files)
+        if removed:
+            logger.info(f"Removed {removed} stale index cache entries")
+    
+    summary = summarize_index_aggregate(aggregate)
     
     # Add execution time
     elapsed_time = time.time() - start_time
-    aggregated["execution_time"] = elapsed_time
+    summary["execution_time"] = elapsed_time
     
-    # Write results to file if specified
+    # Write the summary next to the per-file records
     if output_file:
-        with open(output_file, 'w') as f:
-            json.dump(aggregated, f, indent=2)
-        logger.info(f"Index written to {output_file}")
+        summary_file = f"{output_file}.summary.json"
+        with open(summary_file, 'wb') as f:
+            f.write(dumps_json(summary, indent=True))
+        logger.info(f"Index written to {output_file}, summary to {summary_file}")
     
-    return aggregated
+    return summary
 
 def print_summary(results: Dict[str, Any]) -> None:
     """
@@ -453,16 +650,13 @@ def print_summary(results: Dict[str, Any]) -> None:
             print(f"  {error_file['file_path']}: {error_file['error']}")
     
     # Print most common imports
-    import_counts = {
-        import_name: len(data.get("used_in", []))
-        for import_name, data in results.get("imports", {}).items()
-    }
+    import_counts = results.get("import_counts", {})
     
     if import_counts:
         print("\nMost common imports:")
-        # Sort imports by usage count (descending)
-        sorted_imports = sorted(import_counts.items(), key=lambda x: x[1], reverse=True)
-        for imp, count in sorted_imports[:10]:  # Show top 10
+        # Select the top 10 by usage count without sorting them all
+        top_imports = heapq.nlargest(10, import_counts.items(), key=lambda x: x[1])
+        for imp, count in top_imports:
             print(f"  {imp}: used in {count} files")
     
     # Print execution time
@@ -476,7 +670,9 @@ def main():
     parser.add_argument("--dir", "-d", type=str, default=".", help="Directory to index (default: current directory)")
     parser.add_argument("--batch-size", "-b", type=int, default=10, help="Batch size for processing (default: 10)")
     parser.add_argument("--exclude", "-e", type=str, nargs="+", help="Directories to exclude")
-    parser.add_argument("--output-file", "-o", type=str, help="File to write index to")
+    parser.add_argument("--output-file", "-o", type=str, help="JSON Lines file to write the per-file index to")
+    parser.add_argument("--cache-dir", type=str, help="Directory of cached per-file results for this tree; entries for files no longer indexed are removed (default: one per directory under ~/.cache/ray-indexer)")
+    parser.add_argument("--no-cache", action="store_true", help="Re-index every file, ignoring cached results")
     
     # Index content options
     parser.add_argument("--no-docstrings", action="store_true", help="Don't include docstrings in the index")
@@ -501,7 +697,8 @@ def main():
             include_functions=not args.no_functions,
             include_classes=not args.no_classes,
             include_variables=not args.no_variables,
-            include_line_numbers=not args.no_line_numbers
+            include_line_numbers=not args.no_line_numbers,
+            cache_dir=None if args.no_cache else (args.cache_dir or user_cache_path("ray-indexer", args.dir))
         )
         
         # Print summary